@@ -0,0 +1,37 @@
+import json
+import requests
+
+
+def get_api_url(settings):
+    if settings.environment == "sandbox":
+        return "https://apitest.authorize.net/xml/v1/request.api"
+    return "https://api.authorize.net/xml/v1/request.api"
+
+
+def get_merchant_authentication(settings):
+    return {
+        "name": settings.login_id,
+        "transactionKey": settings.transaction_key,
+    }
+
+
+def parse_response(content: bytes) -> dict:
+    # Authorize.Net prefixes its JSON responses with a byte order mark
+    return json.loads(content.decode("utf-8-sig"))
+
+
+def format_messages(resp: dict):
+    """Returns the general result messages and the transaction errors of a
+    response as two lists of human-readable strings."""
+    messages = [f"{msg['code']}: {msg['text']}" for msg in resp["messages"]["message"]]
+    errors = [
+        f"{msg['errorCode']}: {msg['errorText']}"
+        for msg in resp.get("transactionResponse", {}).get("errors", [])
+    ]
+    return messages, errors
+
+
+def api_request(settings, payload: dict, timeout=None) -> dict:
+    r = requests.post(get_api_url(settings), json=payload, timeout=timeout)
+    r.raise_for_status()
+    return parse_response(r.content)
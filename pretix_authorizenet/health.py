@@ -0,0 +1,81 @@
+import hashlib
+import requests
+import time
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from .api import api_request, format_messages, get_merchant_authentication
+
+# Probes are repeated every few minutes, an unrefreshed status is considered unknown after this many seconds
+HEALTH_CACHE_TIMEOUT = 1800
+PROBE_TIMEOUT = 10
+# Number of consecutive failed probes after which the payment method is hidden during checkout
+FAILURE_THRESHOLD = 2
+
+
+def get_account_key(settings):
+    # The login ID is a credential, we do not want it to show up in cache keys in plain text
+    return hashlib.sha256(
+        f"{settings.environment}:{settings.login_id}".encode()
+    ).hexdigest()[:16]
+
+
+def _health_cache_key(environment, login_id, transaction_key):
+    # Events can use the same login ID with different transaction keys, only one of which might be valid
+    credentials = hashlib.sha256(
+        f"{environment}:{login_id}:{transaction_key}".encode()
+    ).hexdigest()[:16]
+    return f"pretix_authorizenet_health_{credentials}"
+
+
+def get_health_key(settings):
+    return _health_cache_key(
+        settings.environment, settings.login_id, settings.transaction_key
+    )
+
+
+def get_health(settings):
+    if not settings.login_id:
+        return None
+    return cache.get(get_health_key(settings))
+
+
+def reset_health(environment, login_id, transaction_key):
+    """Forgets the status of the given credentials, e.g. because they have just
+    been verified."""
+    cache.delete(_health_cache_key(environment, login_id, transaction_key))
+
+
+def is_healthy(settings):
+    status = get_health(settings)
+    return not status or status["failures"] < FAILURE_THRESHOLD
+
+
+def probe_health(settings):
+    previous = get_health(settings)
+    t0 = time.monotonic()
+    try:
+        resp = api_request(
+            settings,
+            {
+                "authenticateTestRequest": {
+                    "merchantAuthentication": get_merchant_authentication(settings),
+                }
+            },
+            timeout=PROBE_TIMEOUT,
+        )
+        ok = resp["messages"]["resultCode"] == "Ok"
+        message = ", ".join(format_messages(resp)[0])
+    except (requests.RequestException, ValueError, KeyError) as e:
+        ok = False
+        message = str(e)
+
+    status = {
+        "ok": ok,
+        "failures": 0 if ok else (previous["failures"] if previous else 0) + 1,
+        "latency": round((time.monotonic() - t0) * 1000),
+        "message": message,
+        "checked": now(),
+    }
+    cache.set(get_health_key(settings), status, HEALTH_CACHE_TIMEOUT)
+    return status
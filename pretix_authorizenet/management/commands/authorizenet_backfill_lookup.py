@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment, OrderRefund
+
+from ...models import AuthorizeNetTransactionLookup
+
+
+class Command(BaseCommand):
+    help = "Index transaction IDs and card numbers of existing Authorize.Net payments and refunds"
+
+    def _backfill(self, qs):
+        n = 0
+        last_pk = 0
+        while True:
+            batch = list(qs.filter(pk__gt=last_pk).order_by("pk")[:5000])
+            if not batch:
+                break
+            for obj in batch:
+                if not obj.info:
+                    continue
+                if isinstance(obj, OrderRefund):
+                    lookup = AuthorizeNetTransactionLookup.index_response(
+                        obj.info_data, order=obj.order, payment=obj.payment, refund=obj
+                    )
+                else:
+                    lookup = AuthorizeNetTransactionLookup.index_response(
+                        obj.info_data, order=obj.order, payment=obj
+                    )
+                if lookup:
+                    n += 1
+            last_pk = batch[-1].pk
+        return n
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        n = self._backfill(
+            OrderPayment.objects.filter(
+                provider__startswith="authorizenet_",
+                state__in=(
+                    OrderPayment.PAYMENT_STATE_CONFIRMED,
+                    OrderPayment.PAYMENT_STATE_REFUNDED,
+                ),
+            ).select_related("order")
+        )
+        n += self._backfill(
+            OrderRefund.objects.filter(
+                provider__startswith="authorizenet_",
+                state=OrderRefund.REFUND_STATE_DONE,
+            ).select_related("order", "payment")
+        )
+        self.stdout.write(self.style.SUCCESS(f"Indexed {n} transactions."))
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretixbase", "0218_checkinlist_addon_match"),
+        ("pretix_authorizenet", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuthorizeNetTransactionLookup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("trans_id", models.CharField(db_index=True, max_length=190)),
+                (
+                    "network_trans_id",
+                    models.CharField(db_index=True, max_length=190, null=True),
+                ),
+                (
+                    "card_last4",
+                    models.CharField(db_index=True, max_length=4, null=True),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="pretixbase.order",
+                    ),
+                ),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="pretixbase.orderpayment",
+                    ),
+                ),
+                (
+                    "refund",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="pretixbase.orderrefund",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.10 on 2026-10-19 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretixbase", "0218_checkinlist_addon_match"),
+        ("pretix_authorizenet", "0002_authorizenettransactionlookup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuthorizeNetWebhookEvent",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("priority", models.PositiveSmallIntegerField()),
+                ("data", models.TextField()),
+                ("received", models.DateTimeField(auto_now_add=True)),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="pretixbase.orderpayment",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("priority", "pk"),
+            },
+        ),
+        migrations.AddIndex(
+            model_name="authorizenetwebhookevent",
+            index=models.Index(
+                fields=["priority", "id"], name="pretix_auth_priorit_b5a907_idx"
+            ),
+        ),
+    ]
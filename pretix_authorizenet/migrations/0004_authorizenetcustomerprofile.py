@@ -0,0 +1,47 @@
+# Generated by Django 4.2.10 on 2026-10-19 13:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretixbase", "0218_checkinlist_addon_match"),
+        ("pretix_authorizenet", "0003_authorizenetwebhookevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuthorizeNetCustomerProfile",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False
+                    ),
+                ),
+                ("account", models.CharField(db_index=True, max_length=190)),
+                ("customer_profile_id", models.CharField(max_length=190)),
+                ("payment_profile_id", models.CharField(max_length=190)),
+                ("card", models.CharField(max_length=190)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="authorizenet_profiles",
+                        to="pretixbase.customer",
+                    ),
+                ),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="pretixbase.orderpayment",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretix_authorizenet", "0004_authorizenetcustomerprofile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="authorizenetwebhookevent",
+            name="claimed_at",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name="authorizenetwebhookevent",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.10 on 2026-10-19 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pretixbase", "0218_checkinlist_addon_match"),
+        ("pretix_authorizenet", "0005_authorizenetwebhookevent_claimed_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="authorizenetcustomerprofile",
+            name="customer",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="authorizenet_profiles",
+                to="pretixbase.customer",
+            ),
+        ),
+    ]
@@ -5,3 +5,74 @@ class ReferencedAuthorizeNetObject(models.Model):
     reference = models.CharField(max_length=190, db_index=True, unique=True)
     order = models.ForeignKey("pretixbase.Order", on_delete=models.CASCADE)
     payment = models.ForeignKey("pretixbase.OrderPayment", on_delete=models.CASCADE)
+
+
+class AuthorizeNetTransactionLookup(models.Model):
+    """Searchable index of the identifiers support staff get to see in
+    disputes.
+
+    The values are copied out of ``OrderPayment.info`` /
+    ``OrderRefund.info`` when a transaction is executed, since searching
+    the JSON blobs themselves would require a full table scan.
+    """
+
+    order = models.ForeignKey("pretixbase.Order", on_delete=models.CASCADE)
+    payment = models.ForeignKey(
+        "pretixbase.OrderPayment", on_delete=models.CASCADE, null=True
+    )
+    refund = models.ForeignKey(
+        "pretixbase.OrderRefund", on_delete=models.CASCADE, null=True
+    )
+    trans_id = models.CharField(max_length=190, db_index=True)
+    network_trans_id = models.CharField(max_length=190, db_index=True, null=True)
+    card_last4 = models.CharField(max_length=4, db_index=True, null=True)
+
+    @classmethod
+    def index_response(cls, resp: dict, order, payment=None, refund=None):
+        tr = resp.get("transactionResponse") or {}
+        if not tr.get("transId") or tr["transId"] == "0":
+            return None
+        account_number = tr.get("accountNumber") or ""
+        return cls.objects.update_or_create(
+            order=order,
+            payment=payment,
+            refund=refund,
+            defaults={
+                "trans_id": tr["transId"],
+                "network_trans_id": tr.get("networkTransId") or None,
+                "card_last4": (
+                    account_number[-4:] if account_number[-4:].isdigit() else None
+                ),
+            },
+        )[0]
+
+
+class AuthorizeNetWebhookEvent(models.Model):
+    payment = models.ForeignKey("pretixbase.OrderPayment", on_delete=models.CASCADE)
+    priority = models.PositiveSmallIntegerField()
+    data = models.TextField()
+    received = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ("priority", "pk")
+        indexes = [models.Index(fields=["priority", "id"])]
+
+
+class AuthorizeNetCustomerProfile(models.Model):
+    # Profiles of deleted customers are kept until they have been deleted at Authorize.Net as well
+    customer = models.ForeignKey(
+        "pretixbase.Customer",
+        on_delete=models.SET_NULL,
+        related_name="authorizenet_profiles",
+        null=True,
+    )
+    payment = models.ForeignKey(
+        "pretixbase.OrderPayment", on_delete=models.SET_NULL, null=True
+    )
+    account = models.CharField(max_length=190, db_index=True)
+    customer_profile_id = models.CharField(max_length=190)
+    payment_profile_id = models.CharField(max_length=190)
+    card = models.CharField(max_length=190)
+    created = models.DateTimeField(auto_now_add=True)
@@ -1,11 +1,17 @@
+from typing import Union
+
+import hashlib
 import json
 import logging
 import re
 import requests
+import time
+import uuid
 from collections import OrderedDict
 from django import forms
 from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.http import HttpRequest
 from django.template.loader import get_template
@@ -13,15 +19,112 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from pretix.base.forms import SecretKeySettingsField
+from pretix.base.metrics import Counter
 from pretix.base.models import Event, OrderPayment, OrderRefund
 from pretix.base.payment import BasePaymentProvider, PaymentException
 from pretix.base.settings import SettingsSandbox
+from pretix.presale.views.cart import cart_session
 from urllib.parse import urljoin
 
-from .models import ReferencedAuthorizeNetObject
+from .api import api_request, format_messages, get_api_url, get_merchant_authentication
+from .health import get_account_key, get_health, is_healthy, reset_health
+from .models import (
+    AuthorizeNetCustomerProfile,
+    AuthorizeNetTransactionLookup,
+    ReferencedAuthorizeNetObject,
+)
 
 logger = logging.getLogger(__name__)
 
+# Upper bound for how long a payment attempt may hold the lock, in case the worker dies while holding it
+PAYMENT_LOCK_TIMEOUT = 120
+# How long a concurrent attempt waits for the attempt holding the lock before giving up
+PAYMENT_LOCK_WAIT = 30
+
+# Deleting stored cards happens in periodic tasks, which should not be blocked by a slow Authorize.Net for too long
+PROFILE_REQUEST_TIMEOUT = 10
+# Number of unused stored cards deleted at Authorize.Net per run of the periodic task
+PROFILE_CLEANUP_BATCH_SIZE = 100
+
+# Rendered payment details only depend on the payment's info, which is part of the cache key
+INFO_DISPLAY_CACHE_TIMEOUT = 3600 * 24
+
+payment_lock_contention_total = Counter(
+    "pretix_authorizenet_payment_lock_contention_total",
+    "Number of payment attempts that waited for a concurrent attempt for the same payment.",
+    ["outcome"],
+)
+
+
+def _info_display_cache_key(payment: OrderPayment):
+    return "pretix_authorizenet_info_display_{}_{}".format(
+        payment.pk, hashlib.sha1(payment.info.encode()).hexdigest()
+    )
+
+
+def _dicts(value):
+    # Shredded payments contain placeholder strings instead of message lists
+    return [v for v in value if isinstance(v, dict)] if isinstance(value, list) else []
+
+
+def _extract_info_display(info: dict) -> dict:
+    tr = info.get("transactionResponse") or {}
+    return {
+        "trans_id": tr.get("transId"),
+        "network_trans_id": tr.get("networkTransId"),
+        "account_type": tr.get("accountType"),
+        "account_number": tr.get("accountNumber"),
+        "messages": [
+            (msg.get("code"), msg.get("text"))
+            for msg in _dicts((info.get("messages") or {}).get("message"))
+        ]
+        + [
+            (msg.get("code"), msg.get("description"))
+            for msg in _dicts(tr.get("messages"))
+        ]
+        + [
+            (msg.get("errorCode"), msg.get("errorText"))
+            for msg in _dicts(tr.get("errors"))
+        ],
+    }
+
+
+def cache_info_display(payment: OrderPayment, info: dict):
+    display = _extract_info_display(info)
+    cache.set(_info_display_cache_key(payment), display, INFO_DISPLAY_CACHE_TIMEOUT)
+    return display
+
+
+def get_info_display(payment: OrderPayment):
+    """Returns the payment details shown in the backend, without parsing the
+    payment's info on every view."""
+    if not payment.info:
+        return None
+    display = cache.get(_info_display_cache_key(payment))
+    if display is None:
+        display = cache_info_display(payment, json.loads(payment.info))
+    return display
+
+
+def shred_info(d: dict) -> dict:
+    if "transactionResponse" in d:
+        d["transactionResponse"] = {
+            k: "█"
+            for k in d["transactionResponse"].keys()
+            if k
+            not in (
+                "accountType",
+                "messages",
+                "transId",
+                "networkTransId",
+            )
+        }
+
+    d.pop("profileResponse", None)
+
+    d["_shredded"] = True
+    return d
+
 
 class AuthorizeNetSettingsHolder(BasePaymentProvider):
     identifier = "authorizenet"
@@ -82,6 +185,19 @@ class AuthorizeNetSettingsHolder(BasePaymentProvider):
                     ),
                 ),
             ),
+            (
+                "customer_profiles",
+                forms.BooleanField(
+                    label=_("Allow customers to save their card"),
+                    help_text=_(
+                        "Customers who are logged in to a customer account can store their card with Authorize.Net "
+                        "and pay with it again later without entering it again. This requires the Customer "
+                        "Information Manager to be enabled for your Authorize.Net account. If you turn this off "
+                        "again, the stored cards will be deleted unless another event of yours still allows it."
+                    ),
+                    required=False,
+                ),
+            ),
         ]
         d = OrderedDict(
             fields
@@ -100,6 +216,15 @@ class AuthorizeNetSettingsHolder(BasePaymentProvider):
         d.move_to_end("_enabled", last=False)
         return d
 
+    def settings_content_render(self, request):
+        template = get_template("pretix_authorizenet/settings_health.html")
+        ctx = {
+            "enabled": self.settings.get("_enabled", as_type=bool),
+            "health": get_health(self.settings),
+            "healthy": is_healthy(self.settings),
+        }
+        return template.render(ctx)
+
     def settings_form_clean(self, cleaned_data):
         login_id = (
             self.settings.login_id
@@ -123,6 +248,14 @@ class AuthorizeNetSettingsHolder(BasePaymentProvider):
                 auth=(login_id, transaction_key),
             )
             r.raise_for_status()
+            # The credentials work, so a failure recorded by an earlier probe must not keep hiding the payment method
+            # until the next probe
+            reset_health(
+                cleaned_data.get("payment_authorizenet_environment")
+                or self.settings.environment,
+                login_id,
+                transaction_key,
+            )
             if not any(w["url"] == url for w in r.json()):
                 r = requests.post(
                     apiurl,
@@ -191,9 +324,11 @@ class AuthorizeNetMethod(BasePaymentProvider):
 
     @property
     def api_url(self):
-        if self.settings.environment == "sandbox":
-            return "https://apitest.authorize.net/xml/v1/request.api"
-        return "https://api.authorize.net/xml/v1/request.api"
+        return get_api_url(self.settings)
+
+    def is_allowed(self, request: HttpRequest, total=None) -> bool:
+        # Only looks at the result of the last background probe, we never want to wait for Authorize.Net here
+        return is_healthy(self.settings) and super().is_allowed(request, total)
 
     def payment_refund_supported(self, payment: OrderPayment) -> bool:
         # Sources on the internet suggest that refunds are only possible for 90 days, which we could express through
@@ -205,9 +340,32 @@ class AuthorizeNetMethod(BasePaymentProvider):
         return self.payment_refund_supported(payment)
 
     def payment_prepare(self, request, payment):
-        return self.checkout_prepare(request, None)
+        return self._prepare(request, self._get_customer(request, payment.order))
 
     def checkout_prepare(self, request, cart):
+        return self._prepare(request, self._get_customer(request))
+
+    def _get_customer(self, request, order=None):
+        if order:
+            # Everyone with the link to an order can pay for it, but only the customer who placed it gets to use
+            # their saved card
+            if order.customer and getattr(request, "customer", None) == order.customer:
+                return order.customer
+            return None
+        # Logged-in customers can still choose to check out as a guest, so we need to look at what the checkout chose
+        cs = cart_session(request, create=False) or {}
+        if not cs.get("customer"):
+            return None
+        return self.event.organizer.customers.filter(pk=cs["customer"]).first()
+
+    def _prepare(self, request, customer):
+        request.session.pop(f"authorizenet_{self.method}_profile", None)
+        if request.POST.get(f"authorizenet-{self.method}-profile") == "saved":
+            profile = self._get_customer_profile(customer)
+            if profile:
+                request.session[f"authorizenet_{self.method}_profile"] = profile.pk
+                return True
+
         if not request.POST.get(f"authorizenet-{self.method}-datavalue"):
             messages.warning(
                 request,
@@ -220,30 +378,107 @@ class AuthorizeNetMethod(BasePaymentProvider):
         request.session[
             f"authorizenet_{self.method}_datadescriptor"
         ] = request.POST.get(f"authorizenet-{self.method}-datadescriptor")
+        request.session[f"authorizenet_{self.method}_saveprofile"] = bool(
+            customer
+            and self.settings.get("customer_profiles", as_type=bool)
+            and request.POST.get(f"authorizenet-{self.method}-saveprofile")
+        )
         return True
 
     def payment_is_valid_session(self, request: HttpRequest):
+        if request.session.get(f"authorizenet_{self.method}_profile"):
+            return True
         return request.session.get(
             f"authorizenet_{self.method}_datavalue"
         ) and request.session.get(f"authorizenet_{self.method}_datadescriptor")
 
-    def payment_form_render(self, request) -> str:
+    def _get_customer_profile(self, customer):
+        if not customer or not self.settings.get("customer_profiles", as_type=bool):
+            return None
+        return (
+            AuthorizeNetCustomerProfile.objects.filter(
+                customer=customer, account=get_account_key(self.settings)
+            )
+            .order_by("-pk")
+            .first()
+        )
+
+    def _store_customer_profile(self, payment: OrderPayment, resp: dict):
+        profile_resp = resp.get("profileResponse") or {}
+        created = profile_resp.get("messages", {}).get("resultCode") == "Ok"
+        if not created or not profile_resp.get("customerPaymentProfileIdList"):
+            logger.warning(
+                f"Authorize.Net did not create a customer profile for {payment.full_id}: {profile_resp}"
+            )
+            return
+
+        # We only keep one card per customer. The new one replaces all previous ones, which are deleted at
+        # Authorize.Net by a periodic task, so the customer does not need to wait for that.
+        tr = resp["transactionResponse"]
+        AuthorizeNetCustomerProfile.objects.create(
+            customer=payment.order.customer,
+            payment=payment,
+            account=get_account_key(self.settings),
+            customer_profile_id=profile_resp["customerProfileId"],
+            payment_profile_id=profile_resp["customerPaymentProfileIdList"][0],
+            card=f"{tr.get('accountType', '')} {tr.get('accountNumber', '')}".strip(),
+        )
+
+    def _delete_customer_profile(self, profile: AuthorizeNetCustomerProfile):
+        try:
+            resp = api_request(
+                self.settings,
+                {
+                    "deleteCustomerProfileRequest": {
+                        "merchantAuthentication": get_merchant_authentication(
+                            self.settings
+                        ),
+                        "customerProfileId": profile.customer_profile_id,
+                    }
+                },
+                timeout=PROFILE_REQUEST_TIMEOUT,
+            )
+        except Exception:
+            logger.exception("Could not delete customer profile at Authorize.Net")
+            return False
+
+        # E00040 means the profile does not exist (any more), e.g. because it was deleted in the merchant interface
+        codes = [m.get("code") for m in resp.get("messages", {}).get("message", [])]
+        if resp.get("messages", {}).get("resultCode") != "Ok" and "E00040" not in codes:
+            logger.warning(
+                f"Authorize.Net did not delete customer profile {profile.customer_profile_id}: {resp}"
+            )
+            return False
+        profile.delete()
+        return True
+
+    def payment_form_render(self, request, total=None, order=None) -> str:
+        customer = self._get_customer(request, order)
         template = get_template("pretix_authorizenet/checkout_payment_form.html")
         ctx = {
             "request": request,
             "event": self.event,
             "settings": self.settings,
             "method": self.method,
+            "profile": self._get_customer_profile(customer),
+            "save_profile_allowed": customer
+            and self.settings.get("customer_profiles", as_type=bool),
         }
         return template.render(ctx)
 
     def checkout_confirm_render(self, request) -> str:
         template = get_template("pretix_authorizenet/checkout_payment_confirm.html")
+        profile = None
+        if request.session.get(f"authorizenet_{self.method}_profile"):
+            profile = AuthorizeNetCustomerProfile.objects.filter(
+                pk=request.session[f"authorizenet_{self.method}_profile"]
+            ).first()
         ctx = {
             "request": request,
             "event": self.event,
             "settings": self.settings,
             "provider": self,
+            "profile": profile,
         }
         return template.render(ctx)
 
@@ -251,10 +486,6 @@ class AuthorizeNetMethod(BasePaymentProvider):
         return self._is_still_available(order=payment.order)
 
     def payment_pending_render(self, request, payment) -> str:
-        if payment.info:
-            payment_info = json.loads(payment.info)
-        else:
-            payment_info = None
         template = get_template("pretix_authorizenet/pending.html")
         ctx = {
             "request": request,
@@ -263,79 +494,73 @@ class AuthorizeNetMethod(BasePaymentProvider):
             "provider": self,
             "order": payment.order,
             "payment": payment,
-            "payment_info": payment_info,
         }
         return template.render(ctx)
 
     def payment_control_render(self, request, payment) -> str:
-        if payment.info:
-            payment_info = json.loads(payment.info)
-        else:
-            payment_info = None
         template = get_template("pretix_authorizenet/control.html")
         ctx = {
             "request": request,
             "event": self.event,
             "settings": self.settings,
-            "payment_info": payment_info,
+            "payment_info": get_info_display(payment),
             "payment": payment,
             "method": self.method,
             "provider": self,
         }
         return template.render(ctx)
 
+    def _create_transaction_payload(self, ref_id: str, txn: dict) -> dict:
+        return {
+            "createTransactionRequest": {
+                "merchantAuthentication": get_merchant_authentication(self.settings),
+                "refId": ref_id[:20],
+                "transactionRequest": txn,
+            }
+        }
+
+    def _refund_transaction_request(self, refund: OrderRefund, try_void=False) -> dict:
+        payment_tr = refund.payment.info_data["transactionResponse"]
+        if try_void:
+            return {
+                "transactionType": "voidTransaction",
+                "refTransId": payment_tr["transId"],
+            }
+        return {
+            "transactionType": "refundTransaction",
+            "amount": str(refund.amount),
+            "currencyCode": self.event.currency,
+            "payment": {
+                "creditCard": {
+                    "cardNumber": payment_tr["accountNumber"][-4:],
+                    "expirationDate": "XXXX",
+                }
+            },
+            "refTransId": payment_tr["transId"],
+            "order": {
+                "invoiceNumber": refund.full_id[:20],
+                "description": f"{refund.order.code} / {self.event}"[:255],
+            },
+        }
+
     def execute_refund(self, refund: OrderRefund, try_void=False):
         try:
             # Authorize.Net only allows a real "refund" if the transaction is already "settled", approx. 24h after
             # the payment. Before that, we can do a "void". So this function first tries the "refund", then, if the
             # appropriate error message has been received, it tries a "void" instead.
-            if try_void:
-                req = {
-                    "transactionType": "voidTransaction",
-                    "refTransId": refund.payment.info_data["transactionResponse"][
-                        "transId"
-                    ],
-                }
-            else:
-                req = {
-                    "transactionType": "refundTransaction",
-                    "amount": str(refund.amount),
-                    "currencyCode": self.event.currency,
-                    "payment": {
-                        "creditCard": {
-                            "cardNumber": refund.payment.info_data[
-                                "transactionResponse"
-                            ]["accountNumber"][-4:],
-                            "expirationDate": "XXXX",
-                        }
-                    },
-                    "refTransId": refund.payment.info_data["transactionResponse"][
-                        "transId"
-                    ],
-                    "order": {
-                        "invoiceNumber": refund.full_id[:20],
-                        "description": f"{refund.order.code} / {self.event}"[:255],
-                    },
-                }
-            r = requests.post(
-                self.api_url,
-                json={
-                    "createTransactionRequest": {
-                        "merchantAuthentication": {
-                            "name": self.settings.login_id,
-                            "transactionKey": self.settings.transaction_key,
-                        },
-                        "refId": refund.full_id[:20],
-                        "transactionRequest": req,
-                    }
-                },
+            resp = api_request(
+                self.settings,
+                self._create_transaction_payload(
+                    refund.full_id, self._refund_transaction_request(refund, try_void)
+                ),
             )
-            r.raise_for_status()
-            resp = json.loads(r.content.decode("utf-8-sig"))
 
             refund.info_data = resp
             refund.save(update_fields=["info"])
             if resp["messages"]["resultCode"] == "Ok" and resp["transactionResponse"]["responseCode"] == "1":
+                AuthorizeNetTransactionLookup.index_response(
+                    resp, order=refund.order, payment=refund.payment, refund=refund
+                )
                 refund.info_data = resp
                 refund.done()
                 return True
@@ -349,6 +574,8 @@ class AuthorizeNetMethod(BasePaymentProvider):
             ):
                 return self.execute_refund(refund, try_void=True)
             else:
+                resp_messages, resp_errors = format_messages(resp)
+                full_msg = ", ".join(resp_messages + resp_errors)
                 refund.info_data = resp
                 refund.state = OrderRefund.REFUND_STATE_FAILED
                 refund.save()
@@ -357,34 +584,10 @@ class AuthorizeNetMethod(BasePaymentProvider):
                     {
                         "local_id": refund.local_id,
                         "provider": refund.provider,
-                        "message": ", ".join(
-                            [
-                                f"{msg['code']}: {msg['text']}"
-                                for msg in resp["messages"]["message"]
-                            ]
-                            + [
-                                f"{msg['errorCode']}: {msg['errorText']}"
-                                for msg in resp.get("transactionResponse", {}).get(
-                                    "errors", []
-                                )
-                            ]
-                        ),
+                        "message": full_msg,
                     },
                 )
-                raise PaymentException(
-                    ", ".join(
-                        [
-                            f"{msg['code']}: {msg['text']}"
-                            for msg in resp["messages"]["message"]
-                        ]
-                        + [
-                            f"{msg['errorCode']}: {msg['errorText']}"
-                            for msg in resp.get("transactionResponse", {}).get(
-                                "errors", []
-                            )
-                        ]
-                    )
-                )
+                raise PaymentException(full_msg)
         except requests.HTTPError as e:
             logger.exception("Failed to contact Authorize.Net")
             refund.info_data = {
@@ -407,43 +610,127 @@ class AuthorizeNetMethod(BasePaymentProvider):
             )
 
     def execute_payment(self, request: HttpRequest, payment: OrderPayment):
+        # A double-click on "Pay" or a form submitted twice can cause two requests for the same payment to get here
+        # at the same time. Only the first one talks to Authorize.Net, all others wait for and share its result.
+        lock_key = f"pretix_authorizenet_payment_{payment.pk}_lock"
+        result_key = f"pretix_authorizenet_payment_{payment.pk}_result"
+        # The token makes sure we only release our own lock, not one that was acquired after ours timed out
+        token = uuid.uuid4().hex
+        if not cache.add(lock_key, token, PAYMENT_LOCK_TIMEOUT):
+            return self._await_concurrent_payment(payment, lock_key, result_key)
+
         try:
-            r = requests.post(
-                self.api_url,
-                json={
-                    "createTransactionRequest": {
-                        "merchantAuthentication": {
-                            "name": self.settings.login_id,
-                            "transactionKey": self.settings.transaction_key,
-                        },
-                        "refId": payment.full_id[:20],
-                        "transactionRequest": {
-                            "transactionType": "authCaptureTransaction",
-                            "amount": str(payment.amount),
-                            "currencyCode": self.event.currency,
-                            "payment": {
-                                "opaqueData": {
-                                    "dataDescriptor": request.session[
-                                        f"authorizenet_{self.method}_datadescriptor"
-                                    ],
-                                    "dataValue": request.session[
-                                        f"authorizenet_{self.method}_datavalue"
-                                    ],
-                                }
-                            },
-                            "order": {
-                                "invoiceNumber": payment.full_id[:20],
-                                "description": f"{payment.order.code} / {self.event}"[
-                                    :255
-                                ],
-                            },
-                            "poNumber": payment.order.code[:25],
-                        },
-                    }
-                },
+            # pretix only lets payments in state "created" get here, but a concurrent attempt might have finished
+            # between that check and us getting the lock. It must not be charged a second time.
+            payment.refresh_from_db()
+            if payment.state != OrderPayment.PAYMENT_STATE_CREATED:
+                return self._concurrent_payment_result(payment, result_key)
+            self._execute_payment(request, payment)
+        except PaymentException as e:
+            cache.set(result_key, {"error": str(e)}, PAYMENT_LOCK_TIMEOUT)
+            raise
+        except Exception:
+            error = _("We were unable to process your payment. Please try again.")
+            cache.set(result_key, {"error": str(error)}, PAYMENT_LOCK_TIMEOUT)
+            raise
+        else:
+            cache.set(result_key, {"error": None}, PAYMENT_LOCK_TIMEOUT)
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def _await_concurrent_payment(self, payment: OrderPayment, lock_key, result_key):
+        deadline = time.monotonic() + PAYMENT_LOCK_WAIT
+        while cache.get(lock_key) and time.monotonic() < deadline:
+            time.sleep(0.25)
+
+        payment.refresh_from_db()
+        return self._concurrent_payment_result(payment, result_key)
+
+    def _concurrent_payment_result(self, payment: OrderPayment, result_key):
+        result = cache.get(result_key)
+        if payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED:
+            payment_lock_contention_total.inc(1, outcome="confirmed")
+            return
+        elif result and result["error"]:
+            payment_lock_contention_total.inc(1, outcome="failed")
+            raise PaymentException(result["error"])
+        else:
+            payment_lock_contention_total.inc(1, outcome="timeout")
+            raise PaymentException(
+                _(
+                    "Your payment is still being processed. Please check the status of your order in a few minutes "
+                    "before you try again."
+                )
+            )
+
+    def _payment_transaction_request(
+        self, payment: OrderPayment, session, profile=None, save_profile=False
+    ) -> dict:
+        # Authorize.Net validates the JSON against their XML schema, so the order of the keys matters here
+        txn = {
+            "transactionType": "authCaptureTransaction",
+            "amount": str(payment.amount),
+            "currencyCode": self.event.currency,
+        }
+        if profile:
+            txn["profile"] = {
+                "customerProfileId": profile.customer_profile_id,
+                "paymentProfile": {"paymentProfileId": profile.payment_profile_id},
+            }
+        else:
+            txn["payment"] = {
+                "opaqueData": {
+                    "dataDescriptor": session[
+                        f"authorizenet_{self.method}_datadescriptor"
+                    ],
+                    "dataValue": session[f"authorizenet_{self.method}_datavalue"],
+                }
+            }
+            if save_profile:
+                txn["profile"] = {"createProfile": True}
+        txn["order"] = {
+            "invoiceNumber": payment.full_id[:20],
+            "description": f"{payment.order.code} / {self.event}"[:255],
+        }
+        txn["poNumber"] = payment.order.code[:25]
+        if save_profile:
+            # Authorize.Net rejects profiles with the same customer ID and email as an existing one, so we use an ID
+            # that is unique for every profile we create
+            txn["customer"] = {"id": payment.full_id[:20]}
+            if payment.order.customer.email:
+                txn["customer"]["email"] = payment.order.customer.email[:255]
+        return txn
+
+    def _execute_payment(self, request: HttpRequest, payment: OrderPayment):
+        profile = None
+        save_profile = False
+        if request.session.get(f"authorizenet_{self.method}_profile"):
+            profile = self._get_customer_profile(payment.order.customer)
+            if (
+                not profile
+                or profile.pk != request.session[f"authorizenet_{self.method}_profile"]
+            ):
+                raise PaymentException(
+                    _(
+                        "Your saved card is no longer available. Please enter your card details again."
+                    )
+                )
+        else:
+            save_profile = request.session.get(
+                f"authorizenet_{self.method}_saveprofile"
+            ) and bool(payment.order.customer)
+
+        try:
+            resp = api_request(
+                self.settings,
+                self._create_transaction_payload(
+                    payment.full_id,
+                    self._payment_transaction_request(
+                        payment, request.session, profile, save_profile
+                    ),
+                ),
             )
-            r.raise_for_status()
-            resp = json.loads(r.content.decode("utf-8-sig"))
 
             payment.order.log_action("pretix_authorizenet.result", data=resp)
             if resp["messages"]["resultCode"] == "Ok" and resp["transactionResponse"]["responseCode"] == "1":
@@ -452,39 +739,31 @@ class AuthorizeNetMethod(BasePaymentProvider):
                     payment=payment,
                     reference=resp["transactionResponse"]["transId"],
                 )
+                AuthorizeNetTransactionLookup.index_response(
+                    resp, order=payment.order, payment=payment
+                )
                 payment.info_data = resp
                 payment.confirm()
+                cache_info_display(payment, resp)
+                if save_profile:
+                    # The customer has already been charged, failing to save their card must not fail the payment
+                    try:
+                        self._store_customer_profile(payment, resp)
+                    except Exception:
+                        logger.exception(
+                            "Could not store Authorize.Net customer profile"
+                        )
                 return
             else:
+                resp_messages, resp_errors = format_messages(resp)
                 failed = payment.fail(
                     info=resp,
                     log_data={
-                        "message": ", ".join(
-                            [
-                                f"{msg['code']}: {msg['text']}"
-                                for msg in resp["messages"]["message"]
-                            ]
-                            + [
-                                f"{msg['errorCode']}: {msg['errorText']}"
-                                for msg in resp.get("transactionResponse", {}).get(
-                                    "errors", []
-                                )
-                            ]
-                        ),
+                        "message": ", ".join(resp_messages + resp_errors),
                     }
                 )
                 if failed:
-                    full_msg = ", ".join(
-                        [
-                            f"{msg['errorCode']}: {msg['errorText']}"
-                            for msg in resp.get("transactionResponse", {}).get(
-                                "errors", []
-                            )
-                        ] or [
-                            f"{msg['code']}: {msg['text']}"
-                            for msg in resp["messages"]["message"]
-                        ]
-                    )
+                    full_msg = ", ".join(resp_errors or resp_messages)
                     if "transaction has been declined" in full_msg:
                         raise PaymentException(
                             _('Your credit card has been declined. You can retry again or with a different card using '
@@ -516,26 +795,24 @@ class AuthorizeNetMethod(BasePaymentProvider):
                 _("We were unable to contact Authorize.Net. Please try again later.")
             )
 
-    def shred_payment_info(self, obj: OrderPayment):
+    def shred_payment_info(self, obj: Union[OrderPayment, OrderRefund]):
         if not obj.info:
             return
-        d = json.loads(obj.info)
-        if "transactionResponse" in d:
-            d["transactionResponse"] = {
-                k: "█"
-                for k in d["transactionResponse"].keys()
-                if k
-                not in (
-                    "accountType",
-                    "messages",
-                    "transId",
-                    "networkTransId",
-                )
-            }
-
-        d["_shredded"] = True
+        d = shred_info(json.loads(obj.info))
         obj.info = json.dumps(d)
         obj.save(update_fields=["info"])
+        if isinstance(obj, OrderRefund):
+            AuthorizeNetTransactionLookup.objects.filter(refund=obj).update(
+                card_last4=None
+            )
+        else:
+            AuthorizeNetTransactionLookup.objects.filter(payment=obj).update(
+                card_last4=None
+            )
+            # Only the details of payments are shown in the backend, refunds do not need a cached display
+            cache_info_display(obj, d)
+            for profile in AuthorizeNetCustomerProfile.objects.filter(payment=obj):
+                self._delete_customer_profile(profile)
 
 
 class AuthorizeNetCC(AuthorizeNetMethod):
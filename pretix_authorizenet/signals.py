@@ -1,14 +1,27 @@
 import json
 import logging
+from datetime import timedelta
+from django.db.models import Exists, OuterRef, Q
 from django.dispatch import receiver
 from django.http import HttpRequest, HttpResponse
 from django.template.loader import get_template
 from django.urls import resolve
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
+from django_scopes import scopes_disabled
 from pretix.base.middleware import _merge_csp, _parse_csp, _render_csp
-from pretix.base.signals import logentry_display, register_payment_providers
+from pretix.base.models import Event
+from pretix.base.signals import (
+    logentry_display,
+    periodic_task,
+    register_payment_providers,
+)
+from pretix.control.signals import order_search_filter_q
+from pretix.helpers.periodic import minimum_interval
 from pretix.presale.signals import html_head, process_response
 
+from .models import AuthorizeNetTransactionLookup
+
 logger = logging.getLogger(__name__)
 
 
@@ -40,6 +53,25 @@ def html_head_presale(sender, request=None, **kwargs):
         return ""
 
 
+def add_csp(header, environment):
+    h = _parse_csp(header) if header else {}
+    csps = {}
+
+    if environment == "sandbox":
+        csps["script-src"] = ["https://jstest.authorize.net"]
+        csps["frame-src"] = ["https://jstest.authorize.net"]
+    else:
+        csps["script-src"] = ["https://js.authorize.net"]
+        csps["frame-src"] = ["https://js.authorize.net"]
+
+    # Authorize.Net unfortunately applies styles through their script-src
+    # Also, the unsafe-inline needs to specified within single quotes!
+    csps["style-src"] = ["'unsafe-inline'"]
+
+    _merge_csp(h, csps)
+    return _render_csp(h)
+
+
 @receiver(signal=process_response, dispatch_uid="payment_authorizenet_middleware_resp")
 def signal_process_response(
     sender, request: HttpRequest, response: HttpResponse, **kwargs
@@ -52,27 +84,9 @@ def signal_process_response(
     if provider.settings.get("_enabled", as_type=bool) and (
         "checkout" in url.url_name or "order.pay" in url.url_name
     ):
-        if "Content-Security-Policy" in response:
-            h = _parse_csp(response["Content-Security-Policy"])
-        else:
-            h = {}
-        csps = {}
-
-        if provider.settings.environment == "sandbox":
-            csps["script-src"] = ["https://jstest.authorize.net"]
-            csps["frame-src"] = ["https://jstest.authorize.net"]
-        else:
-            csps["script-src"] = ["https://js.authorize.net"]
-            csps["frame-src"] = ["https://js.authorize.net"]
-
-        # Authorize.Net unfortunately applies styles through their script-src
-        # Also, the unsafe-inline needs to specified within single quotes!
-        csps["style-src"] = ["'unsafe-inline'"]
-
-        _merge_csp(h, csps)
-
-        if h:
-            response["Content-Security-Policy"] = _render_csp(h)
+        response["Content-Security-Policy"] = add_csp(
+            response.get("Content-Security-Policy"), provider.settings.environment
+        )
     return response
 
 
@@ -89,3 +103,120 @@ def pretixcontrol_logentry_display(sender, logentry, **kwargs):
     elif logentry.action_type == "pretix_authorizenet.result":
         return _("Authorize.Net result received.")
 
+
+@receiver(order_search_filter_q, dispatch_uid="authorizenet_order_search_filter_q")
+def order_search_filter(sender, query, **kwargs):
+    query = query.strip()
+    if not query or len(query) > 190:
+        return Q()
+
+    q = Q(trans_id=query) | Q(network_trans_id=query)
+    # Authorize.Net displays card numbers as XXXX1111, support staff will often paste them just like that
+    last4 = query.upper().removeprefix("XXXX")
+    if len(last4) == 4 and last4.isdigit():
+        q |= Q(card_last4=last4)
+    lookups = AuthorizeNetTransactionLookup.objects.filter(q)
+    if sender:
+        lookups = lookups.filter(order__event=sender)
+    return Q(pk__in=lookups.values("order_id"))
+
+
+@receiver(periodic_task, dispatch_uid="authorizenet_periodic_webhook_buffer")
+def process_webhook_buffer(sender, **kwargs):
+    from . import webhooks
+
+    slot = webhooks.acquire_slot(0)
+    if not slot:
+        return
+    try:
+        with scopes_disabled():
+            webhooks.process_buffered_events()
+    finally:
+        webhooks.release_slot(slot)
+
+
+@receiver(periodic_task, dispatch_uid="authorizenet_periodic_health_probe")
+@minimum_interval(minutes_after_success=5, minutes_after_error=5)
+def probe_api_health(sender, **kwargs):
+    from .health import get_health_key, probe_health
+    from .payment import AuthorizeNetSettingsHolder
+
+    probed = set()
+    with scopes_disabled():
+        events = Event.objects.filter(
+            Q(has_subevents=True)
+            | Q(date_to__gte=now())
+            | Q(date_from__gte=now() - timedelta(days=1)),
+            plugins__contains="pretix_authorizenet",
+        )
+        for event in events:
+            provider = AuthorizeNetSettingsHolder(event)
+            if not provider.settings.get(
+                "_enabled", as_type=bool
+            ) or not provider.settings.get("login_id"):
+                continue
+            # Many events usually share the same merchant account, one probe per account is enough
+            key = get_health_key(provider.settings)
+            if key in probed:
+                continue
+            probed.add(key)
+            try:
+                probe_health(provider.settings)
+            except Exception:
+                logger.exception("Could not probe Authorize.Net API health")
+
+
+@receiver(periodic_task, dispatch_uid="authorizenet_periodic_customer_profile_cleanup")
+@minimum_interval(minutes_after_success=60, minutes_after_error=15)
+def delete_unused_customer_profiles(sender, **kwargs):
+    from .health import get_account_key
+    from .models import AuthorizeNetCustomerProfile
+    from .payment import PROFILE_CLEANUP_BATCH_SIZE, AuthorizeNetCC
+
+    providers = {}
+    in_use = set()
+    with scopes_disabled():
+        for event in Event.objects.filter(plugins__contains="pretix_authorizenet"):
+            provider = AuthorizeNetCC(event)
+            if not provider.settings.get("login_id"):
+                continue
+            account = get_account_key(provider.settings)
+            # Any event using the same merchant account can authenticate the deletion
+            providers.setdefault(account, provider)
+            if provider.settings.get(
+                "_enabled", as_type=bool
+            ) and provider.settings.get("customer_profiles", as_type=bool):
+                in_use.add((event.organizer_id, account))
+
+        # Profiles are unused if a newer card replaced them, their customer was deleted or anonymized, or no event
+        # of the organizer allows saved cards any more
+        unused = (
+            Q(superseded=True)
+            | Q(customer__isnull=True)
+            | Q(customer__is_active=False, customer__email__isnull=True)
+        )
+        for organizer_id, account in (
+            AuthorizeNetCustomerProfile.objects.filter(customer__isnull=False)
+            .values_list("customer__organizer_id", "account")
+            .distinct()
+        ):
+            if (organizer_id, account) not in in_use:
+                unused |= Q(customer__organizer_id=organizer_id, account=account)
+
+        # Profiles of merchant accounts no event has credentials for cannot be deleted, we keep them in case the
+        # credentials come back
+        profiles = (
+            AuthorizeNetCustomerProfile.objects.annotate(
+                superseded=Exists(
+                    AuthorizeNetCustomerProfile.objects.filter(
+                        customer=OuterRef("customer"),
+                        account=OuterRef("account"),
+                        pk__gt=OuterRef("pk"),
+                    )
+                )
+            )
+            .filter(unused, account__in=providers)
+            .order_by("pk")
+        )
+        for profile in profiles[:PROFILE_CLEANUP_BATCH_SIZE]:
+            providers[profile.account]._delete_customer_profile(profile)
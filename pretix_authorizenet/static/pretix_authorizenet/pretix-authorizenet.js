@@ -3,10 +3,11 @@
 
 var pretixauthorizenet = {
     authorizenet: null,
+    sdk_callbacks: null,
     continue_button: null,
 
     load: function () {
-        if (pretixauthorizenet.authorizenet !== null) {
+        if (pretixauthorizenet.continue_button !== null) {
             return
         }
         pretixauthorizenet.continue_button = $('.checkout-button-row').closest("form").find(".checkout-button-row .btn-primary");
@@ -27,6 +28,19 @@ var pretixauthorizenet = {
         pretixauthorizenet.continue_button.closest('div').append($cont);
 
         pretixauthorizenet.continue_button.prop("disabled", true).addClass("authorizenet-hidden");
+    },
+
+    loadSdk: function (callback) {
+        // The SDK is only loaded once it is actually needed, customers paying with a saved card never need it
+        if (pretixauthorizenet.authorizenet !== null) {
+            callback();
+            return;
+        }
+        if (pretixauthorizenet.sdk_callbacks !== null) {
+            pretixauthorizenet.sdk_callbacks.push(callback);
+            return;
+        }
+        pretixauthorizenet.sdk_callbacks = [callback];
 
         let sdk_url = $("#authorizenet_sdkurl").text();
 
@@ -48,6 +62,10 @@ var pretixauthorizenet = {
                 if (head && sdkscript.parentNode) {
                     head.removeChild(sdkscript);
                 }
+
+                for (var cb of pretixauthorizenet.sdk_callbacks) {
+                    cb();
+                }
             }
         };
     },
@@ -61,7 +79,14 @@ var pretixauthorizenet = {
             pretixauthorizenet.restore();
         });
 
-        if ($("input[name=payment][value^='authorizenet']").is(':checked') || $(".payment-redo-form").length) {
+        $("input[name=authorizenet-creditcard-profile]").change(function () {
+            $(".authorizenet-newcard").toggleClass("authorizenet-hidden", pretixauthorizenet.usesSavedCard());
+            if (pretixauthorizenet.isSelected()) {
+                pretixauthorizenet.renderButton($("input[name=payment][value^='authorizenet']:checked").val());
+            }
+        });
+
+        if (pretixauthorizenet.isSelected()) {
             pretixauthorizenet.renderButton($("input[name=payment][value^='authorizenet']:checked").val());
         } else {
             pretixauthorizenet.restore();
@@ -74,9 +99,27 @@ var pretixauthorizenet = {
         pretixauthorizenet.continue_button.prop("disabled", false).removeClass("authorizenet-hidden");
     },
 
+    isSelected: function () {
+        return $("input[name=payment][value^='authorizenet']").is(':checked') || $(".payment-redo-form").length;
+    },
+
+    usesSavedCard: function () {
+        return $("input[name=authorizenet-creditcard-profile]:checked").val() === "saved";
+    },
+
     renderButton: function (method) {
-        $('#authorizenet-button-container').removeClass("authorizenet-hidden")
-        pretixauthorizenet.continue_button.addClass("authorizenet-hidden");
+        if (pretixauthorizenet.usesSavedCard()) {
+            // Saved cards are charged by the server, the regular continue button is all we need
+            pretixauthorizenet.restore();
+            return;
+        }
+        pretixauthorizenet.continue_button.prop("disabled", true).addClass("authorizenet-hidden");
+        pretixauthorizenet.loadSdk(function () {
+            if (!pretixauthorizenet.isSelected() || pretixauthorizenet.usesSavedCard()) {
+                return;
+            }
+            $('#authorizenet-button-container').removeClass("authorizenet-hidden")
+        });
     },
 
     handleResponse: function (response) {
@@ -101,15 +144,7 @@ $(function () {
         return;
     }
     pretixauthorizenet.load();
-
-    function checkReady() {
-        if (!pretixauthorizenet.authorizenet) {
-            return window.setTimeout(checkReady, 500);
-        }
-        pretixauthorizenet.ready();
-    }
-
-    checkReady();
+    pretixauthorizenet.ready();
 });
 
 window.pretixAuthorizeNetResponse = function (response) {
@@ -1,14 +1,12 @@
-import hashlib
-import hmac
 import json
 import logging
-from decimal import Decimal
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django_scopes import scopes_disabled
-from pretix.base.models import OrderPayment, OrderRefund
+from pretix.base.models import OrderRefund
 
+from . import webhooks
 from .models import ReferencedAuthorizeNetObject
 
 logger = logging.getLogger(__name__)
@@ -50,32 +48,27 @@ def webhook(request, *args, **kwargs):
 
     provider = payment.payment_provider
 
-    received_signature = request.headers["X-Anet-Signature"].split("=")[-1].upper()
-    computed_signature = (
-        hmac.new(provider.settings.signature_key.encode(), request.body, hashlib.sha512)
-        .hexdigest()
-        .upper()
-    )
-    if received_signature != computed_signature:
+    if not webhooks.verify_signature(
+        provider.settings.signature_key,
+        request.body,
+        request.headers["X-Anet-Signature"],
+    ):
         logger.info(f"Received authorize.net webhook with invalid signature: {data}")
         return HttpResponse("Invalid signature", status=200)
 
-    payment.order.log_action("pretix_authorizenet.event", data=data)
+    # Authorize.Net replays its whole backlog at once after an outage on our side. To keep this from starving
+    # checkout traffic, we only process a limited number of events at the same time and buffer the rest.
+    priority = webhooks.get_priority(data)
+    slot = webhooks.acquire_slot(priority)
+    if not slot:
+        if webhooks.buffer_event(payment, data, priority):
+            return HttpResponse("Queued.", status=200)
+        return HttpResponse("Overloaded.", status=200)
 
-    if data["eventType"] == "net.authorize.payment.void.created":
-        payment.create_external_refund(
-            payment.amount, info=json.dumps(data["payload"])
-        )
-    elif data["eventType"] == "net.authorize.payment.refund.created":
-        payment.create_external_refund(
-            Decimal(data["payload"]["authAmount"]), info=json.dumps(data["payload"])
-        )
-    elif data[
-        "eventType"
-    ] == "net.authorize.payment.fraud.declined" and payment.state not in (
-        OrderPayment.PAYMENT_STATE_CONFIRMED,
-        OrderPayment.PAYMENT_STATE_REFUNDED,
-    ):
-        payment.fail()
+    try:
+        webhooks.process_event(payment, data)
+        webhooks.process_buffered_events(limit=webhooks.DRAIN_BATCH_SIZE)
+    finally:
+        webhooks.release_slot(slot)
 
     return HttpResponse("OK", status=200)
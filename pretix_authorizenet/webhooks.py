@@ -0,0 +1,161 @@
+import hashlib
+import hmac
+import json
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+from pretix.base.metrics import Counter
+from pretix.base.models import OrderPayment
+
+from .models import AuthorizeNetWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers are processed first. Declined fraud reviews, refunds and voids change the state of a payment, all
+# other events are only recorded in the order log.
+EVENT_PRIORITIES = {
+    "net.authorize.payment.fraud.declined": 0,
+    "net.authorize.payment.refund.created": 1,
+    "net.authorize.payment.void.created": 1,
+}
+DEFAULT_PRIORITY = 2
+
+# Upper bound for how long a slot may be held, in case the worker dies while holding it
+SLOT_TIMEOUT = 300
+# Number of buffered events a webhook request works off after handling its own event
+DRAIN_BATCH_SIZE = 10
+# Time after which a buffered event is retried if processing it failed, or the worker died while processing it
+CLAIM_TIMEOUT = 300
+# Number of attempts after which a buffered event is given up on
+MAX_ATTEMPTS = 10
+
+webhook_events_total = Counter(
+    "pretix_authorizenet_webhook_events_total",
+    "Number of Authorize.Net webhook events received, by how they were handled.",
+    ["outcome"],
+)
+
+
+def verify_signature(signature_key: str, body: bytes, header: str) -> bool:
+    received_signature = header.split("=")[-1].upper()
+    computed_signature = (
+        hmac.new(signature_key.encode(), body, hashlib.sha512).hexdigest().upper()
+    )
+    return hmac.compare_digest(received_signature, computed_signature)
+
+
+def get_priority(data: dict) -> int:
+    return EVENT_PRIORITIES.get(data["eventType"], DEFAULT_PRIORITY)
+
+
+def acquire_slot(priority: int):
+    """Returns the cache key of a free webhook processing slot, or ``None`` if
+    all slots are in use.
+
+    The last slot is reserved for events that actually change a payment,
+    so a flood of informational events can never block them entirely.
+    With a concurrency of 1, there is nothing to reserve and all events
+    share the single slot.
+    """
+    concurrency = settings.CONFIG_FILE.getint(
+        "authorizenet", "webhook_concurrency", fallback=4
+    )
+    if priority >= DEFAULT_PRIORITY:
+        concurrency = max(1, concurrency - 1)
+    for i in range(concurrency):
+        key = f"pretix_authorizenet_webhook_slot_{i}"
+        if cache.add(key, True, SLOT_TIMEOUT):
+            return key
+    return None
+
+
+def release_slot(key):
+    cache.delete(key)
+
+
+def buffer_event(payment: OrderPayment, data: dict, priority: int) -> bool:
+    """Stores an event for later processing.
+
+    If the buffer is full, the least important and most recent buffered
+    events are dropped. This may be the new event itself, if nothing
+    less important than it is buffered. Returns ``False`` in that case.
+    """
+    size = settings.CONFIG_FILE.getint(
+        "authorizenet", "webhook_buffer_size", fallback=1000
+    )
+    event = AuthorizeNetWebhookEvent.objects.create(
+        payment=payment, priority=priority, data=json.dumps(data)
+    )
+    # We trim the buffer after inserting instead of checking its size before, so concurrent requests cannot push it
+    # beyond its size. In return, concurrent requests might drop a few more events than strictly necessary.
+    overflow = dict(
+        AuthorizeNetWebhookEvent.objects.order_by("priority", "pk").values_list(
+            "pk", "data"
+        )[size:]
+    )
+    if overflow:
+        AuthorizeNetWebhookEvent.objects.filter(pk__in=overflow).delete()
+        for dropped in overflow.values():
+            logger.warning(
+                f"Authorize.Net webhook buffer is full, dropping event: {dropped}"
+            )
+            webhook_events_total.inc(1, outcome="dropped")
+        if event.pk in overflow:
+            return False
+    webhook_events_total.inc(1, outcome="buffered")
+    return True
+
+
+def process_buffered_events(limit=None):
+    # A claim expires after a while, so events are retried if processing failed or the worker died while processing
+    unclaimed = Q(claimed_at__isnull=True) | Q(
+        claimed_at__lt=now() - timedelta(seconds=CLAIM_TIMEOUT)
+    )
+    qs = AuthorizeNetWebhookEvent.objects.filter(unclaimed).select_related(
+        "payment", "payment__order"
+    )
+    for event in qs.order_by("priority", "pk")[:limit]:
+        # Claim the event, so concurrent workers do not process it at the same time
+        if not AuthorizeNetWebhookEvent.objects.filter(unclaimed, pk=event.pk).update(
+            claimed_at=now(), attempts=F("attempts") + 1
+        ):
+            continue
+        try:
+            with transaction.atomic():
+                process_event(event.payment, json.loads(event.data))
+                event.delete()
+        except Exception:
+            if event.attempts + 1 >= MAX_ATTEMPTS:
+                logger.exception(
+                    f"Could not process buffered Authorize.Net webhook event, giving up: {event.data}"
+                )
+                event.delete()
+                webhook_events_total.inc(1, outcome="failed")
+            else:
+                logger.exception(
+                    "Could not process buffered Authorize.Net webhook event, will retry"
+                )
+
+
+def process_event(payment: OrderPayment, data: dict):
+    payment.order.log_action("pretix_authorizenet.event", data=data)
+
+    if data["eventType"] == "net.authorize.payment.void.created":
+        payment.create_external_refund(payment.amount, info=json.dumps(data["payload"]))
+    elif data["eventType"] == "net.authorize.payment.refund.created":
+        payment.create_external_refund(
+            Decimal(data["payload"]["authAmount"]), info=json.dumps(data["payload"])
+        )
+    elif data[
+        "eventType"
+    ] == "net.authorize.payment.fraud.declined" and payment.state not in (
+        OrderPayment.PAYMENT_STATE_CONFIRMED,
+        OrderPayment.PAYMENT_STATE_REFUNDED,
+    ):
+        payment.fail()
+    webhook_events_total.inc(1, outcome="processed")
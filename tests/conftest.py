@@ -1 +1,130 @@
-# put your pytest fixtures here
+import json
+import os
+import pytest
+from decimal import Decimal
+from django.core.cache import cache
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from pretix.base.models import Event, Order, OrderPayment, OrderRefund, Organizer
+
+from pretix_authorizenet import health, payment as payment_module
+from pretix_authorizenet.payment import AuthorizeNetCC
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    # Locks, health status and cached displays need a cache that actually stores something
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def load_fixture():
+    def load(name):
+        with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+            return f.read()
+
+    return load
+
+
+@pytest.fixture
+def approved_response(load_fixture):
+    return json.loads(load_fixture("create_transaction_approved.json"))
+
+
+@pytest.fixture
+def event():
+    with scopes_disabled():
+        o = Organizer.objects.create(name="Dummy", slug="dummy")
+        event = Event.objects.create(
+            organizer=o,
+            name="Dummy",
+            slug="dummy",
+            currency="USD",
+            date_from=now(),
+            plugins="pretix_authorizenet",
+        )
+        event.settings.payment_authorizenet_login_id = "5KP3u95bQpv"
+        event.settings.payment_authorizenet_transaction_key = "346HZ32z3fP4hTG2"
+        event.settings.payment_authorizenet_signature_key = "A" * 128
+        yield event
+
+
+@pytest.fixture
+def order(event):
+    return Order.objects.create(
+        code="FOO",
+        event=event,
+        email="dummy@dummy.test",
+        status=Order.STATUS_PAID,
+        datetime=now(),
+        expires=now(),
+        total=Decimal("13.37"),
+        sales_channel=event.organizer.sales_channels.get(identifier="web"),
+    )
+
+
+@pytest.fixture
+def payment(order, approved_response):
+    return order.payments.create(
+        provider="authorizenet_creditcard",
+        amount=Decimal("13.37"),
+        state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+        info=json.dumps(approved_response),
+    )
+
+
+@pytest.fixture
+def refund(order, payment):
+    return order.refunds.create(
+        provider="authorizenet_creditcard",
+        amount=Decimal("13.37"),
+        state=OrderRefund.REFUND_STATE_CREATED,
+        source=OrderRefund.REFUND_SOURCE_ADMIN,
+        payment=payment,
+    )
+
+
+@pytest.fixture
+def pending_payment(order):
+    return order.payments.create(
+        provider="authorizenet_creditcard",
+        amount=order.total,
+        state=OrderPayment.PAYMENT_STATE_CREATED,
+    )
+
+
+@pytest.fixture
+def provider(event):
+    return AuthorizeNetCC(event)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Replaces all calls to the Authorize.Net API.
+
+    Each call is recorded in ``api.requests`` and answered with the next
+    item of ``api.responses``, which is raised instead if it is an
+    exception.
+    """
+    requests = []
+    responses = []
+
+    def api_request(settings, payload, timeout=None):
+        requests.append(payload)
+        resp = responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+    api_request.requests = requests
+    api_request.responses = responses
+    monkeypatch.setattr(payment_module, "api_request", api_request)
+    monkeypatch.setattr(health, "api_request", api_request)
+    return api_request
@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import json
+import pytest
+
+from pretix_authorizenet.api import format_messages, parse_response
+from pretix_authorizenet.payment import (
+    AuthorizeNetCC,
+    _extract_info_display,
+    shred_info,
+)
+from pretix_authorizenet.signals import add_csp
+from pretix_authorizenet.webhooks import verify_signature
+
+# Authorize.Net prefixes all responses with a byte order mark
+BOM = b"\xef\xbb\xbf"
+
+
+@pytest.mark.django_db
+def test_build_payment_request(benchmark, event, payment):
+    provider = AuthorizeNetCC(event)
+    session = {
+        "authorizenet_creditcard_datadescriptor": "COMMON.ACCEPT.INAPP.PAYMENT",
+        "authorizenet_creditcard_datavalue": "eyJjb2RlIjoiNTBfMl8wNjAwMDUyN0JE" * 8,
+    }
+
+    def build():
+        return provider._create_transaction_payload(
+            payment.full_id, provider._payment_transaction_request(payment, session)
+        )
+
+    payload = benchmark(build)
+    txn = payload["createTransactionRequest"]["transactionRequest"]
+    assert list(txn) == [
+        "transactionType",
+        "amount",
+        "currencyCode",
+        "payment",
+        "order",
+        "poNumber",
+    ]
+    assert txn["amount"] == "13.37"
+
+
+@pytest.mark.django_db
+def test_build_refund_request(benchmark, event, refund):
+    provider = AuthorizeNetCC(event)
+
+    def build():
+        return provider._create_transaction_payload(
+            refund.full_id, provider._refund_transaction_request(refund)
+        )
+
+    payload = benchmark(build)
+    txn = payload["createTransactionRequest"]["transactionRequest"]
+    assert txn["refTransId"] == "80017434569"
+    assert txn["payment"]["creditCard"]["cardNumber"] == "1111"
+
+
+@pytest.mark.parametrize(
+    "fixture",
+    [
+        "create_transaction_approved.json",
+        "create_transaction_declined.json",
+        "create_transaction_unsettled.json",
+    ],
+)
+def test_parse_response(benchmark, load_fixture, fixture):
+    content = BOM + load_fixture(fixture)
+    resp = benchmark(parse_response, content)
+    assert resp["messages"]["resultCode"] in ("Ok", "Error")
+
+
+def test_format_messages(benchmark, load_fixture):
+    resp = json.loads(load_fixture("create_transaction_declined.json"))
+    messages, errors = benchmark(format_messages, resp)
+    assert messages == ["E00027: The transaction was unsuccessful."]
+    assert errors == ["2: This transaction has been declined."]
+
+
+def test_shred_info(benchmark, load_fixture):
+    info = load_fixture("create_transaction_approved.json").decode()
+
+    def shred():
+        return json.dumps(shred_info(json.loads(info)))
+
+    d = json.loads(benchmark(shred))
+    assert d["_shredded"]
+    assert "XXXX1111" not in json.dumps(d)
+
+
+def test_extract_info_display(benchmark, approved_response):
+    display = benchmark(_extract_info_display, approved_response)
+    assert display["account_number"] == "XXXX1111"
+    assert display["messages"][0] == ("I00001", "Successful.")
+
+
+def test_verify_signature(benchmark, load_fixture):
+    key = "A" * 128
+    body = load_fixture("webhook_authcapture_created.json")
+    header = (
+        "sha512=" + hmac.new(key.encode(), body, hashlib.sha512).hexdigest().upper()
+    )
+    assert benchmark(verify_signature, key, body, header)
+    assert not verify_signature(key, body + b" ", header)
+
+
+@pytest.mark.parametrize("environment", ["production", "sandbox"])
+def test_add_csp(benchmark, environment):
+    header = (
+        "default-src 'self'; script-src 'self' 'unsafe-eval'; "
+        "style-src 'self'; frame-src 'self'; img-src * data:"
+    )
+    csp = benchmark(add_csp, header, environment)
+    assert "authorize.net" in csp
+    assert "'unsafe-inline'" in csp
@@ -0,0 +1,375 @@
+import copy
+import pytest
+from django.contrib.sessions.backends.cache import SessionStore
+from django_scopes import scopes_disabled
+from pretix.base.models import OrderPayment
+from pretix.base.payment import PaymentException
+from pretix.presale.views.cart import cart_session
+
+from pretix_authorizenet.health import get_account_key
+from pretix_authorizenet.models import AuthorizeNetCustomerProfile
+from pretix_authorizenet.signals import delete_unused_customer_profiles
+
+DELETED = {
+    "messages": {
+        "resultCode": "Ok",
+        "message": [{"code": "I00001", "text": "Successful."}],
+    }
+}
+NOT_FOUND = {
+    "messages": {
+        "resultCode": "Error",
+        "message": [{"code": "E00040", "text": "The record cannot be found."}],
+    }
+}
+ERROR = {
+    "messages": {
+        "resultCode": "Error",
+        "message": [{"code": "E00001", "text": "An error occurred."}],
+    }
+}
+
+
+@pytest.fixture
+def customer(event, order):
+    event.settings.payment_authorizenet__enabled = True
+    event.settings.payment_authorizenet_customer_profiles = True
+    with scopes_disabled():
+        customer = event.organizer.customers.create(
+            email="customer@example.org", is_active=True, is_verified=True
+        )
+    order.customer = customer
+    order.save()
+    return customer
+
+
+@pytest.fixture
+def profile_response(approved_response):
+    resp = copy.deepcopy(approved_response)
+    resp["profileResponse"] = {
+        "messages": {
+            "resultCode": "Ok",
+            "message": [{"code": "I00001", "text": "Successful."}],
+        },
+        "customerProfileId": "500",
+        "customerPaymentProfileIdList": ["600"],
+        "customerShippingAddressIdList": [],
+    }
+    return resp
+
+
+def create_profile(provider, customer, n=1):
+    return AuthorizeNetCustomerProfile.objects.create(
+        customer=customer,
+        account=get_account_key(provider.settings),
+        customer_profile_id=str(n),
+        payment_profile_id=str(n + 1),
+        card="Visa XXXX2222",
+    )
+
+
+def new_card_session(save=True):
+    return {
+        "authorizenet_creditcard_datadescriptor": "COMMON.ACCEPT.INAPP.PAYMENT",
+        "authorizenet_creditcard_datavalue": "abc",
+        "authorizenet_creditcard_saveprofile": save,
+    }
+
+
+def request_with_session(rf, event, session, customer=None, data=None):
+    request = rf.post("/", data or {})
+    request.event = event
+    request.organizer = event.organizer
+    request.customer = customer
+    request.session = SessionStore()
+    request.session.update(session)
+    return request
+
+
+@pytest.mark.django_db
+def test_save_card(
+    rf, event, provider, api, customer, pending_payment, profile_response
+):
+    api.responses.append(profile_response)
+    provider.execute_payment(
+        request_with_session(rf, event, new_card_session()), pending_payment
+    )
+
+    txn = api.requests[0]["createTransactionRequest"]["transactionRequest"]
+    assert txn["profile"] == {"createProfile": True}
+    assert txn["customer"] == {
+        "id": pending_payment.full_id,
+        "email": "customer@example.org",
+    }
+    pending_payment.refresh_from_db()
+    assert pending_payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+
+    profile = AuthorizeNetCustomerProfile.objects.get()
+    assert profile.customer == customer
+    assert profile.payment == pending_payment
+    assert (profile.customer_profile_id, profile.payment_profile_id) == ("500", "600")
+    assert profile.card == "Visa XXXX1111"
+
+
+@pytest.mark.django_db
+def test_save_card_without_email(
+    rf, event, provider, api, customer, pending_payment, profile_response
+):
+    customer.email = None
+    customer.save()
+    api.responses.append(profile_response)
+    provider.execute_payment(
+        request_with_session(rf, event, new_card_session()), pending_payment
+    )
+    txn = api.requests[0]["createTransactionRequest"]["transactionRequest"]
+    assert txn["customer"] == {"id": pending_payment.full_id}
+    assert AuthorizeNetCustomerProfile.objects.exists()
+
+
+@pytest.mark.django_db
+def test_save_card_not_requested(
+    rf, event, provider, api, customer, pending_payment, approved_response
+):
+    api.responses.append(approved_response)
+    provider.execute_payment(
+        request_with_session(rf, event, new_card_session(save=False)), pending_payment
+    )
+    txn = api.requests[0]["createTransactionRequest"]["transactionRequest"]
+    assert "profile" not in txn
+    assert "customer" not in txn
+    assert not AuthorizeNetCustomerProfile.objects.exists()
+
+
+@pytest.mark.django_db
+def test_new_card_replaces_saved_card(
+    rf, event, provider, api, customer, pending_payment, profile_response
+):
+    old = create_profile(provider, customer)
+    api.responses.append(profile_response)
+    provider.execute_payment(
+        request_with_session(rf, event, new_card_session()), pending_payment
+    )
+
+    # The old card is deleted later, the customer does not need to wait for that
+    assert len(api.requests) == 1
+    assert provider._get_customer_profile(customer).customer_profile_id == "500"
+
+    api.responses.append(DELETED)
+    delete_unused_customer_profiles(sender=None)
+    assert api.requests[1]["deleteCustomerProfileRequest"]["customerProfileId"] == "1"
+    assert not AuthorizeNetCustomerProfile.objects.filter(pk=old.pk).exists()
+    assert AuthorizeNetCustomerProfile.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_malformed_profile_response_does_not_fail_payment(
+    rf, event, provider, api, customer, pending_payment, profile_response
+):
+    del profile_response["profileResponse"]["customerProfileId"]
+    api.responses.append(profile_response)
+    provider.execute_payment(
+        request_with_session(rf, event, new_card_session()), pending_payment
+    )
+    pending_payment.refresh_from_db()
+    assert pending_payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+    assert not AuthorizeNetCustomerProfile.objects.exists()
+
+
+@pytest.mark.django_db
+def test_pay_with_saved_card(
+    rf, event, provider, api, customer, pending_payment, approved_response
+):
+    profile = create_profile(provider, customer)
+    api.responses.append(approved_response)
+    provider.execute_payment(
+        request_with_session(
+            rf, event, {"authorizenet_creditcard_profile": profile.pk}
+        ),
+        pending_payment,
+    )
+
+    txn = api.requests[0]["createTransactionRequest"]["transactionRequest"]
+    assert "payment" not in txn
+    assert txn["profile"] == {
+        "customerProfileId": "1",
+        "paymentProfile": {"paymentProfileId": "2"},
+    }
+    pending_payment.refresh_from_db()
+    assert pending_payment.state == OrderPayment.PAYMENT_STATE_CONFIRMED
+
+
+@pytest.mark.django_db
+def test_pay_with_removed_saved_card(
+    rf, event, provider, api, customer, pending_payment
+):
+    profile = create_profile(provider, customer)
+    request = request_with_session(
+        rf, event, {"authorizenet_creditcard_profile": profile.pk}
+    )
+    profile.delete()
+    with pytest.raises(PaymentException, match="no longer available"):
+        provider.execute_payment(request, pending_payment)
+    assert api.requests == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("logged_in,allowed", [(True, True), (False, False)])
+def test_order_payment_requires_login(
+    rf, event, provider, customer, pending_payment, logged_in, allowed
+):
+    profile = create_profile(provider, customer)
+    request = request_with_session(
+        rf,
+        event,
+        {},
+        customer=customer if logged_in else None,
+        data={
+            "authorizenet-creditcard-profile": "saved",
+            "authorizenet-creditcard-datavalue": "abc",
+            "authorizenet-creditcard-datadescriptor": "COMMON.ACCEPT.INAPP.PAYMENT",
+            "authorizenet-creditcard-saveprofile": "on",
+        },
+    )
+    assert provider.payment_prepare(request, pending_payment)
+    assert (
+        request.session.get("authorizenet_creditcard_profile") == profile.pk
+    ) == allowed
+
+    request.session.pop("authorizenet_creditcard_profile", None)
+    request.POST = request.POST.copy()
+    request.POST["authorizenet-creditcard-profile"] = "new"
+    assert provider.payment_prepare(request, pending_payment)
+    assert request.session["authorizenet_creditcard_saveprofile"] == allowed
+    assert (
+        "XXXX2222" in provider.payment_form_render(request, order=pending_payment.order)
+    ) == allowed
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("guest", [True, False])
+def test_checkout_uses_customer_of_checkout(rf, event, provider, customer, guest):
+    create_profile(provider, customer)
+    request = request_with_session(
+        rf,
+        event,
+        {},
+        customer=customer,
+        data={
+            "authorizenet-creditcard-datavalue": "abc",
+            "authorizenet-creditcard-datadescriptor": "COMMON.ACCEPT.INAPP.PAYMENT",
+            "authorizenet-creditcard-saveprofile": "on",
+        },
+    )
+    cart_session(request)["customer"] = None if guest else customer.pk
+    assert provider.checkout_prepare(request, [])
+    assert request.session["authorizenet_creditcard_saveprofile"] != guest
+    assert ("XXXX2222" in provider.payment_form_render(request)) != guest
+
+
+@pytest.mark.django_db
+def test_shred_deletes_saved_card(event, provider, api, customer, payment):
+    profile = create_profile(provider, customer)
+    profile.payment = payment
+    profile.save()
+    api.responses.append(DELETED)
+    with scopes_disabled():
+        provider.shred_payment_info(payment)
+    assert api.requests[0]["deleteCustomerProfileRequest"]["customerProfileId"] == "1"
+    assert not AuthorizeNetCustomerProfile.objects.exists()
+
+
+def deleted_profiles(api):
+    return [
+        r["deleteCustomerProfileRequest"]["customerProfileId"] for r in api.requests
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "delete_response,deleted", [(DELETED, True), (NOT_FOUND, True), (ERROR, False)]
+)
+def test_cleanup_checks_response(provider, api, customer, delete_response, deleted):
+    old = create_profile(provider, customer, 1)
+    create_profile(provider, customer, 3)
+    api.responses.append(delete_response)
+    delete_unused_customer_profiles(sender=None)
+    assert deleted_profiles(api) == ["1"]
+    # If Authorize.Net did not delete the card, we keep it and try again later
+    assert AuthorizeNetCustomerProfile.objects.filter(pk=old.pk).exists() != deleted
+
+
+@pytest.mark.django_db
+def test_cleanup_keeps_cards_in_use(provider, api, customer):
+    create_profile(provider, customer)
+    delete_unused_customer_profiles(sender=None)
+    assert api.requests == []
+    assert AuthorizeNetCustomerProfile.objects.exists()
+
+
+@pytest.mark.django_db
+def test_cleanup_anonymized_customer(provider, api, customer):
+    create_profile(provider, customer)
+    with scopes_disabled():
+        other = customer.organizer.customers.create(
+            email="other@example.org", is_active=False
+        )
+    create_profile(provider, other, 3)
+    customer.anonymize()
+    api.responses.append(DELETED)
+    delete_unused_customer_profiles(sender=None)
+    # Deactivated customers might be activated again
+    assert deleted_profiles(api) == ["1"]
+    assert list(
+        AuthorizeNetCustomerProfile.objects.values_list("customer", flat=True)
+    ) == [other.pk]
+
+
+@pytest.mark.django_db
+def test_cleanup_deleted_customer(provider, api, customer, order):
+    profile = create_profile(provider, customer)
+    with scopes_disabled():
+        order.delete()
+        customer.delete()
+    profile.refresh_from_db()
+    assert profile.customer is None
+    api.responses.append(DELETED)
+    delete_unused_customer_profiles(sender=None)
+    assert deleted_profiles(api) == ["1"]
+    assert not AuthorizeNetCustomerProfile.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("other_event_allows", [True, False])
+def test_cleanup_when_saving_cards_disabled(
+    event, provider, api, customer, other_event_allows
+):
+    create_profile(provider, customer)
+    with scopes_disabled():
+        other = event.organizer.events.create(
+            name="Other",
+            slug="other",
+            date_from=event.date_from,
+            plugins="pretix_authorizenet",
+        )
+    other.settings.payment_authorizenet_login_id = (
+        event.settings.payment_authorizenet_login_id
+    )
+    other.settings.payment_authorizenet__enabled = True
+    other.settings.payment_authorizenet_customer_profiles = other_event_allows
+    event.settings.payment_authorizenet_customer_profiles = False
+
+    api.responses.append(DELETED)
+    delete_unused_customer_profiles(sender=None)
+    assert deleted_profiles(api) == ([] if other_event_allows else ["1"])
+    assert AuthorizeNetCustomerProfile.objects.exists() == other_event_allows
+
+
+@pytest.mark.django_db
+def test_cleanup_without_credentials(event, provider, api, customer, order):
+    create_profile(provider, customer)
+    customer.anonymize()
+    event.settings.payment_authorizenet_login_id = "other"
+    delete_unused_customer_profiles(sender=None)
+    # Nobody can authenticate the deletion, so we keep the card until the credentials come back
+    assert api.requests == []
+    assert AuthorizeNetCustomerProfile.objects.exists()
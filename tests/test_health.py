@@ -0,0 +1,114 @@
+import pytest
+import requests
+from django.contrib.sessions.backends.cache import SessionStore
+
+from pretix_authorizenet import health, payment as payment_module
+from pretix_authorizenet.payment import AuthorizeNetCC, AuthorizeNetSettingsHolder
+from pretix_authorizenet.signals import probe_api_health
+
+
+@pytest.fixture
+def checkout_request(rf, event):
+    request = rf.get("/")
+    request.event = event
+    request.session = SessionStore()
+    return request
+
+
+OK = {
+    "messages": {
+        "resultCode": "Ok",
+        "message": [{"code": "I00001", "text": "Successful."}],
+    }
+}
+
+
+@pytest.mark.django_db
+def test_hidden_after_failed_probes(provider, checkout_request, api):
+    assert health.get_health(provider.settings) is None
+    assert provider.is_allowed(checkout_request)
+
+    api.responses.append(requests.ConnectionError("Connection refused"))
+    status = health.probe_health(provider.settings)
+    assert not status["ok"]
+    assert status["failures"] == 1
+    assert status["message"] == "Connection refused"
+    # A single failed probe might be a fluke
+    assert provider.is_allowed(checkout_request)
+
+    api.responses.append(
+        {
+            "messages": {
+                "resultCode": "Error",
+                "message": [{"code": "E00007", "text": "User authentication failed."}],
+            }
+        }
+    )
+    status = health.probe_health(provider.settings)
+    assert status["failures"] == 2
+    assert status["message"] == "E00007: User authentication failed."
+    assert not provider.is_allowed(checkout_request)
+
+    api.responses.append(OK)
+    status = health.probe_health(provider.settings)
+    assert status["ok"]
+    assert status["failures"] == 0
+    assert provider.is_allowed(checkout_request)
+
+
+@pytest.fixture
+def failed_twice(provider, api):
+    api.responses.extend([ValueError("Invalid JSON"), ValueError("Invalid JSON")])
+    health.probe_health(provider.settings)
+    health.probe_health(provider.settings)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "setting", ["payment_authorizenet_login_id", "payment_authorizenet_transaction_key"]
+)
+def test_health_per_credentials(
+    event, provider, checkout_request, failed_twice, setting
+):
+    assert not provider.is_allowed(checkout_request)
+
+    event.settings.set(setting, "other")
+    provider = AuthorizeNetCC(event)
+    assert health.get_health(provider.settings) is None
+    assert provider.is_allowed(checkout_request)
+
+
+@pytest.mark.django_db
+def test_health_reset_when_credentials_verified(
+    event, provider, checkout_request, failed_twice, monkeypatch
+):
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return [{"url": "http://example.com/_authorizenet/webhook/"}]
+
+    monkeypatch.setattr(payment_module.requests, "get", lambda *a, **kw: Response())
+    monkeypatch.setattr(payment_module.requests, "post", lambda *a, **kw: Response())
+    AuthorizeNetSettingsHolder(event).settings_form_clean(
+        {
+            "payment_authorizenet_login_id": "*****",
+            "payment_authorizenet_transaction_key": "*****",
+        }
+    )
+    assert health.get_health(provider.settings) is None
+    assert provider.is_allowed(checkout_request)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("live", [True, False])
+def test_probe_enabled_events(event, provider, api, live):
+    # Admins enter their credentials while the shop is not live yet, they should see the result right away
+    event.live = live
+    event.save()
+    event.settings.payment_authorizenet__enabled = True
+    api.responses.append(OK)
+    probe_api_health(sender=None)
+    assert len(api.requests) == 1
+    assert health.get_health(provider.settings)["ok"]
@@ -0,0 +1,61 @@
+import json
+import pytest
+from django_scopes import scopes_disabled
+
+from pretix_authorizenet import payment as payment_module
+from pretix_authorizenet.payment import AuthorizeNetCC, get_info_display
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    calls = []
+    extract = payment_module._extract_info_display
+
+    def counting_extract(info):
+        calls.append(info)
+        return extract(info)
+
+    monkeypatch.setattr(payment_module, "_extract_info_display", counting_extract)
+    return calls
+
+
+@pytest.mark.django_db
+def test_display_cached(payment, extractions):
+    display = get_info_display(payment)
+    assert display["trans_id"] == "80017434569"
+    assert display["account_number"] == "XXXX1111"
+    assert get_info_display(payment) == display
+    assert len(extractions) == 1
+
+
+@pytest.mark.django_db
+def test_display_invalidated_when_info_changes(payment, approved_response, extractions):
+    get_info_display(payment)
+
+    approved_response["transactionResponse"]["accountNumber"] = "XXXX2222"
+    payment.info_data = approved_response
+    payment.save()
+    assert get_info_display(payment)["account_number"] == "XXXX2222"
+    assert len(extractions) == 2
+
+    # Other instances of the same payment see the new info as well
+    payment.refresh_from_db()
+    assert get_info_display(payment)["account_number"] == "XXXX2222"
+    assert len(extractions) == 2
+
+
+@pytest.mark.django_db
+def test_display_after_shredding(event, payment, refund, extractions):
+    assert get_info_display(payment)["account_number"] == "XXXX1111"
+    refund.info = payment.info
+    refund.save()
+
+    with scopes_disabled():
+        AuthorizeNetCC(event).shred_payment_info(payment)
+        AuthorizeNetCC(event).shred_payment_info(refund)
+    payment.refresh_from_db()
+    display = get_info_display(payment)
+    assert "XXXX1111" not in json.dumps(display)
+    # Shredding already cached the new display, refunds are not cached at all
+    assert len(extractions) == 2
+    assert display == payment_module._extract_info_display(payment.info_data)
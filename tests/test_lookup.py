@@ -0,0 +1,114 @@
+import json
+import pytest
+from django.core.management import call_command
+from django.db.models import Q
+from django_scopes import scopes_disabled
+from io import StringIO
+from pretix.base.models import Order, OrderPayment, OrderRefund
+
+from pretix_authorizenet.models import AuthorizeNetTransactionLookup
+from pretix_authorizenet.payment import AuthorizeNetCC
+from pretix_authorizenet.signals import order_search_filter
+
+
+@pytest.fixture
+def done_refund(refund, approved_response):
+    approved_response["transactionResponse"]["transId"] = "80017434570"
+    refund.state = OrderRefund.REFUND_STATE_DONE
+    refund.info = json.dumps(approved_response)
+    refund.save()
+    return refund
+
+
+def search(event, query):
+    with scopes_disabled():
+        return list(
+            Order.objects.filter(order_search_filter(sender=event, query=query))
+        )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "query,found",
+    [
+        ("80017434569", True),
+        (" 80017434569 ", True),
+        ("BVM2TNHJVPZVTSNRX8EPOBL", True),
+        ("1111", True),
+        ("XXXX1111", True),
+        ("xxxx1111", True),
+        ("8001743456", False),
+        ("2222", False),
+    ],
+)
+def test_search(event, order, payment, approved_response, query, found):
+    AuthorizeNetTransactionLookup.index_response(
+        approved_response, order=order, payment=payment
+    )
+    assert search(event, query) == ([order] if found else [])
+
+
+def test_search_empty_query():
+    # An empty Q does not contribute anything when pretix combines it with its own search
+    assert order_search_filter(sender=None, query="  ") == Q()
+
+
+@pytest.mark.django_db
+def test_search_limited_to_event(event, order, payment, approved_response):
+    AuthorizeNetTransactionLookup.index_response(
+        approved_response, order=order, payment=payment
+    )
+    with scopes_disabled():
+        other = event.organizer.events.create(
+            name="Other", slug="other", date_from=event.date_from
+        )
+    assert search(other, "80017434569") == []
+    assert search(None, "80017434569") == [order]
+
+
+@pytest.mark.django_db
+def test_backfill(order, payment, done_refund):
+    with scopes_disabled():
+        order.payments.create(
+            provider="authorizenet_creditcard",
+            amount=payment.amount,
+            state=OrderPayment.PAYMENT_STATE_FAILED,
+            info=payment.info,
+        )
+    out = StringIO()
+    call_command("authorizenet_backfill_lookup", stdout=out)
+    assert "Indexed 2 transactions." in out.getvalue()
+
+    assert set(
+        AuthorizeNetTransactionLookup.objects.values_list(
+            "payment", "refund", "trans_id", "card_last4"
+        )
+    ) == {
+        (payment.pk, None, "80017434569", "1111"),
+        (payment.pk, done_refund.pk, "80017434570", "1111"),
+    }
+
+    # Running the command again does not create duplicates
+    call_command("authorizenet_backfill_lookup", stdout=StringIO())
+    assert AuthorizeNetTransactionLookup.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_shred(event, order, payment, done_refund):
+    call_command("authorizenet_backfill_lookup", stdout=StringIO())
+    provider = AuthorizeNetCC(event)
+    with scopes_disabled():
+        provider.shred_payment_info(payment)
+        provider.shred_payment_info(done_refund)
+        payment.refresh_from_db()
+        done_refund.refresh_from_db()
+
+    assert payment.info_data["_shredded"]
+    assert done_refund.info_data["_shredded"]
+    assert not AuthorizeNetTransactionLookup.objects.filter(
+        card_last4__isnull=False
+    ).exists()
+    # Transaction IDs are not personal data and remain searchable
+    assert search(event, "80017434569") == [order]
+    assert search(event, "80017434570") == [order]
+    assert search(event, "1111") == []
@@ -0,0 +1,112 @@
+import pytest
+from django.core.cache import cache
+from pretix.base.models import OrderPayment
+from pretix.base.payment import PaymentException
+
+from pretix_authorizenet import payment as payment_module
+
+LOCK_KEY = "pretix_authorizenet_payment_{}_lock"
+RESULT_KEY = "pretix_authorizenet_payment_{}_result"
+
+
+@pytest.fixture
+def provider(provider, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        provider, "_execute_payment", lambda request, payment: calls.append(payment)
+    )
+    provider.calls = calls
+    monkeypatch.setattr(payment_module, "PAYMENT_LOCK_WAIT", 0)
+    return provider
+
+
+@pytest.mark.django_db
+def test_lock_released(provider, pending_payment):
+    provider.execute_payment(None, pending_payment)
+    assert provider.calls == [pending_payment]
+    assert cache.get(LOCK_KEY.format(pending_payment.pk)) is None
+    assert cache.get(RESULT_KEY.format(pending_payment.pk)) == {"error": None}
+
+
+@pytest.mark.django_db
+def test_concurrent_attempt_shares_success(provider, pending_payment):
+    cache.set(LOCK_KEY.format(pending_payment.pk), "other")
+    pending_payment.confirm()
+    provider.execute_payment(None, pending_payment)
+    assert provider.calls == []
+
+
+@pytest.mark.django_db
+def test_concurrent_attempt_shares_error(provider, pending_payment):
+    cache.set(LOCK_KEY.format(pending_payment.pk), "other")
+    cache.set(RESULT_KEY.format(pending_payment.pk), {"error": "Declined."})
+    with pytest.raises(PaymentException, match="Declined."):
+        provider.execute_payment(None, pending_payment)
+    assert provider.calls == []
+
+
+@pytest.mark.django_db
+def test_concurrent_attempt_times_out(provider, pending_payment):
+    cache.set(LOCK_KEY.format(pending_payment.pk), "other")
+    with pytest.raises(PaymentException, match="still being processed"):
+        provider.execute_payment(None, pending_payment)
+    assert provider.calls == []
+    assert cache.get(LOCK_KEY.format(pending_payment.pk)) == "other"
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "exception,error",
+    [
+        (PaymentException("Declined."), "Declined."),
+        (
+            ValueError("Unexpected response"),
+            "We were unable to process your payment. Please try again.",
+        ),
+    ],
+)
+def test_failure_shared(provider, pending_payment, monkeypatch, exception, error):
+    def fail(request, payment):
+        raise exception
+
+    monkeypatch.setattr(provider, "_execute_payment", fail)
+    with pytest.raises(type(exception)):
+        provider.execute_payment(None, pending_payment)
+    assert cache.get(LOCK_KEY.format(pending_payment.pk)) is None
+    assert cache.get(RESULT_KEY.format(pending_payment.pk)) == {"error": error}
+
+    cache.set(LOCK_KEY.format(pending_payment.pk), "other")
+    with pytest.raises(PaymentException, match=error):
+        provider.execute_payment(None, pending_payment)
+
+
+@pytest.mark.django_db
+def test_foreign_lock_not_released(provider, pending_payment, monkeypatch):
+    def slow(request, payment):
+        # Our lock expired and another attempt acquired it in the meantime
+        cache.set(LOCK_KEY.format(payment.pk), "other")
+
+    monkeypatch.setattr(provider, "_execute_payment", slow)
+    provider.execute_payment(None, pending_payment)
+    assert cache.get(LOCK_KEY.format(pending_payment.pk)) == "other"
+
+
+@pytest.mark.django_db
+def test_payment_confirmed_before_lock_acquired(provider, pending_payment):
+    # pretix checked the state of the payment before the first attempt confirmed it and released the lock
+    stale = OrderPayment.objects.get(pk=pending_payment.pk)
+    pending_payment.confirm()
+    provider.execute_payment(None, stale)
+    assert provider.calls == []
+    assert cache.get(LOCK_KEY.format(pending_payment.pk)) is None
+
+
+@pytest.mark.django_db
+def test_payment_failed_before_lock_acquired(provider, pending_payment):
+    stale = OrderPayment.objects.get(pk=pending_payment.pk)
+    pending_payment.fail()
+    cache.set(RESULT_KEY.format(pending_payment.pk), {"error": "Declined."})
+    with pytest.raises(PaymentException, match="Declined."):
+        provider.execute_payment(None, stale)
+    assert provider.calls == []
+    assert cache.get(LOCK_KEY.format(pending_payment.pk)) is None
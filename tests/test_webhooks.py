@@ -0,0 +1,192 @@
+import hashlib
+import hmac
+import json
+import pytest
+from datetime import timedelta
+from django.urls import reverse
+from django.utils.timezone import now
+
+from pretix_authorizenet import webhooks
+from pretix_authorizenet.models import (
+    AuthorizeNetWebhookEvent,
+    ReferencedAuthorizeNetObject,
+)
+
+
+def event_data(event_type, n=0):
+    return {"eventType": event_type, "notificationId": str(n), "payload": {}}
+
+
+def buffered():
+    return [
+        (e.priority, json.loads(e.data)["notificationId"])
+        for e in AuthorizeNetWebhookEvent.objects.all()
+    ]
+
+
+@pytest.mark.parametrize(
+    "event_type,priority",
+    [
+        ("net.authorize.payment.fraud.declined", 0),
+        ("net.authorize.payment.refund.created", 1),
+        ("net.authorize.payment.void.created", 1),
+        ("net.authorize.payment.fraud.held", 2),
+        ("net.authorize.payment.fraud.approved", 2),
+        ("net.authorize.payment.authcapture.created", 2),
+    ],
+)
+def test_priority(event_type, priority):
+    assert webhooks.get_priority(event_data(event_type)) == priority
+
+
+def test_last_slot_reserved():
+    slots = [webhooks.acquire_slot(2) for _ in range(3)]
+    assert all(slots) and len(set(slots)) == 3
+    assert webhooks.acquire_slot(2) is None
+
+    last = webhooks.acquire_slot(1)
+    assert last and last not in slots
+    assert webhooks.acquire_slot(0) is None
+
+    webhooks.release_slot(slots[0])
+    assert webhooks.acquire_slot(2) == slots[0]
+
+
+def test_single_slot_shared(monkeypatch):
+    monkeypatch.setenv("PRETIX_AUTHORIZENET_WEBHOOK_CONCURRENCY", "1")
+    slot = webhooks.acquire_slot(2)
+    assert slot
+    assert webhooks.acquire_slot(0) is None
+    webhooks.release_slot(slot)
+    assert webhooks.acquire_slot(0) == slot
+
+
+@pytest.mark.django_db
+def test_buffer_eviction(monkeypatch, payment):
+    monkeypatch.setenv("PRETIX_AUTHORIZENET_WEBHOOK_BUFFER_SIZE", "3")
+    assert webhooks.buffer_event(payment, event_data("a", 1), 2)
+    assert webhooks.buffer_event(payment, event_data("b", 2), 2)
+    assert webhooks.buffer_event(payment, event_data("c", 3), 1)
+    assert buffered() == [(1, "3"), (2, "1"), (2, "2")]
+
+    # The most recent of the least important events makes room
+    assert webhooks.buffer_event(payment, event_data("d", 4), 0)
+    assert buffered() == [(0, "4"), (1, "3"), (2, "1")]
+
+    # Nothing less important than the new event is left, so it is dropped itself
+    assert not webhooks.buffer_event(payment, event_data("e", 5), 2)
+    assert webhooks.buffer_event(payment, event_data("f", 6), 1)
+    assert not webhooks.buffer_event(payment, event_data("g", 7), 1)
+    assert buffered() == [(0, "4"), (1, "3"), (1, "6")]
+
+
+@pytest.mark.django_db
+def test_drain(payment, monkeypatch):
+    processed = []
+    monkeypatch.setattr(
+        webhooks,
+        "process_event",
+        lambda payment, data: processed.append(data["notificationId"]),
+    )
+    for n, priority in enumerate([2, 1, 2, 0]):
+        webhooks.buffer_event(payment, event_data("a", n), priority)
+
+    webhooks.process_buffered_events(limit=3)
+    assert processed == ["3", "1", "0"]
+    assert buffered() == [(2, "2")]
+
+    webhooks.process_buffered_events()
+    assert processed == ["3", "1", "0", "2"]
+    assert buffered() == []
+
+
+@pytest.mark.django_db
+def test_drain_retries_failed_events(payment, monkeypatch):
+    processed = []
+
+    def process_event(payment, data):
+        payment.order.log_action("pretix_authorizenet.event", data=data)
+        processed.append(data["notificationId"])
+        if data["notificationId"] == "1":
+            raise ValueError("Database is gone")
+
+    monkeypatch.setattr(webhooks, "process_event", process_event)
+    webhooks.buffer_event(
+        payment, event_data("net.authorize.payment.refund.created", 1), 1
+    )
+    webhooks.buffer_event(payment, event_data("a", 2), 2)
+
+    webhooks.process_buffered_events()
+    assert processed == ["1", "2"]
+    assert buffered() == [(1, "1")]
+    # Everything the failed attempt did was rolled back
+    assert (
+        payment.order.all_logentries()
+        .filter(action_type="pretix_authorizenet.event")
+        .count()
+        == 1
+    )
+
+    # The event is not retried right away ...
+    webhooks.process_buffered_events()
+    assert processed == ["1", "2"]
+
+    # ... but once its claim has expired
+    for attempt in range(2, webhooks.MAX_ATTEMPTS + 1):
+        AuthorizeNetWebhookEvent.objects.update(
+            claimed_at=now() - timedelta(seconds=webhooks.CLAIM_TIMEOUT + 1)
+        )
+        webhooks.process_buffered_events()
+        assert processed.count("1") == attempt
+    assert buffered() == []
+
+
+@pytest.fixture
+def post_webhook(client, event, payment):
+    ReferencedAuthorizeNetObject.objects.create(
+        reference="80017434569", order=payment.order, payment=payment
+    )
+
+    def post(data):
+        body = json.dumps(data).encode()
+        signature = hmac.new(
+            event.settings.payment_authorizenet_signature_key.encode(),
+            body,
+            hashlib.sha512,
+        ).hexdigest()
+        return client.post(
+            reverse("plugins:pretix_authorizenet:webhook"),
+            body,
+            content_type="application/json",
+            HTTP_X_ANET_SIGNATURE=f"sha512={signature}",
+        )
+
+    return post
+
+
+@pytest.mark.django_db
+def test_webhook_buffered_without_slot(post_webhook, load_fixture, payment):
+    data = json.loads(load_fixture("webhook_authcapture_created.json"))
+    slots = [webhooks.acquire_slot(2) for _ in range(3)]
+    r = post_webhook(data)
+    assert r.content == b"Queued."
+    assert buffered() == [(2, data["notificationId"])]
+    assert (
+        not payment.order.all_logentries()
+        .filter(action_type="pretix_authorizenet.event")
+        .exists()
+    )
+
+    webhooks.release_slot(slots[0])
+    data["notificationId"] = "other"
+    r = post_webhook(data)
+    assert r.content == b"OK"
+    assert buffered() == []
+    assert (
+        payment.order.all_logentries()
+        .filter(action_type="pretix_authorizenet.event")
+        .count()
+        == 2
+    )
+    # The slot was released again
+    assert webhooks.acquire_slot(2) == slots[0]